@@ -1,34 +1,59 @@
 import requests
 import pandas as pd
-import json
+import orjson
 import os
 import time
+import math
+import threading
+import multiprocessing
 import shutil
 import logging
+import logging.handlers
 import csv
 import re
 import hashlib
 import tempfile
+import glob
+import zipfile
+import xlsxwriter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from contextlib import nullcontext
 from datetime import datetime
+from itertools import islice
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import escape
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- CONFIGURAÇÃO GLOBAL DE PRIVACIDADE (LGPD) ---
 # True: Ativa Anonimização (Hash SHA-256 + Máscara) | False: Mantém Dados Reais
 ANONYMIZE_STUDENTS = True
 
+# --- CONFIGURAÇÃO DE SAÍDA GOLD ---
+# True: Gera também um CSV por aba (em paralelo) | False: Somente o relatório consolidado XLSX
+EMIT_CSV = False
+
 # --- SISTEMA DE TELEMETRIA E LOG EXAUSTIVO (Pasta logs + Micro-tempos) ---
 LOG_DIR = "logs"
 os.makedirs(LOG_DIR, exist_ok=True)
 LOG_DATE = datetime.now().strftime('%Y%m%d_%H%M%S')
 LOG_FILE = os.path.join(LOG_DIR, f"{LOG_DATE}_udemy_full_audit.log")
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    handlers=[
-        logging.FileHandler(LOG_FILE, encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+LOG_FORMAT = '%(asctime)s [%(levelname)s] %(message)s'
+
+# Processos filhos do Gold (spawn reimporta o módulo) não criam um novo arquivo de auditoria
+if multiprocessing.parent_process() is None:
+    file_handler = logging.FileHandler(LOG_FILE, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logging.basicConfig(
+        level=logging.INFO,
+        format=LOG_FORMAT,
+        handlers=[
+            # Escrita em disco em lotes de 1024 registros; WARNING+ (e o encerramento) descarregam na hora
+            logging.handlers.MemoryHandler(capacity=1024, flushLevel=logging.WARNING, target=file_handler),
+            logging.StreamHandler()
+        ]
+    )
 logger = logging.getLogger(__name__)
 
 # --- CONFIGURAÇÕES DE ROBUSTEZ E PERFORMANCE ---
@@ -36,9 +61,23 @@ MAX_TEXT_LENGTH = 32000
 DEFAULT_ENCODING = "utf-8"  # Fix definitivo para UnicodeDecodeError (byte 0x81)
 OUTPUT_ENCODING = "utf-8-sig"
 API_TIMEOUT = 60  # Proteção contra Bad Gateway (502) observada nos logs
+API_PAGE_SIZE = 200
+API_MAX_WORKERS = 8  # Páginas baixadas em paralelo (I/O-bound)
+API_RATE_LIMIT = 4.0  # Requisições por segundo somando todas as threads
+API_RETRY = Retry(total=5, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504], allowed_methods=["GET"])
+GOLD_MAX_WORKERS = os.cpu_count() or 1  # Processos para limpeza + CSV por aba (EMIT_CSV)
+BRONZE_CHUNK_SIZE = 50_000  # Registros por lote na leitura do Bronze (limita o pico de memória)
+# Controles inválidos no XML do Excel. Regex mantido de propósito: str.translate com tabela de
+# deleção mediu 4-9x mais lento por célula (sem caractere ilegal) e ~4x por coluna vs str.replace.
+ILLEGAL_CHARS_RE = re.compile(r'[\000-\010]|[\013-\014]|[\016-\037]')
+XML_SHEET_THRESHOLD = 100_000  # Abas maiores são geradas como XML direto (sem o loop por célula do xlsxwriter)
+EXCEL_OPTIONS = {'constant_memory': True, 'strings_to_urls': False}  # Modo write-only do xlsxwriter
+EXCEL_MAX_ROWS, EXCEL_MAX_COLS = 1_048_576, 16_384  # Limites da planilha (o write_row só retorna -1 além deles)
 
 # --- ESTRUTURA DE PASTAS (ARQUITETURA MEDALHÃO) ---
 BRONZE_DIR, SILVER_DIR, GOLD_DIR = "01_bronze", "02_silver", "03_gold"
+STUDENT_MASK_MAP = f"{SILVER_DIR}/student_mask_map.json"  # Hash -> "Aluno NN", estável entre execuções
+SILVER_FINGERPRINT = f"{SILVER_DIR}/.bronze_fingerprint"  # Impressão digital do Bronze que gerou a Silver atual
 COURSE_PAGE_DIR = f"{BRONZE_DIR}/00_course/00_pages"
 ACTIVITY_PAGE_DIR = f"{BRONZE_DIR}/01_activity/00_pages"
 COURSE_ACT_PAGE_DIR = f"{BRONZE_DIR}/02_user_course_activity/00_pages"
@@ -77,6 +116,12 @@ TABLE_NAME_MAP = {
     "stg_categories": "Categorias", "stg_sub_categories": "Subcategorias"
 }
 
+# Chave primária de cada dimensão Silver (deduplicação pela chave, não pelo registro inteiro)
+DIMENSION_KEYS = {
+    "stg_instructors": "instructor_id", "stg_languages": "language_id", "stg_levels": "level_id",
+    "stg_categories": "cat_id", "stg_sub_categories": "sub_id"
+}
+
 # Dicionário de Tradução de Cabeçalhos (PT-BR) com Métricas Completas
 COLUMN_TRANSLATION_MAP = {
     "student_id": "ID_Estudante", "full_name": "Nome_Completo", "course_id": "ID_Curso",
@@ -105,19 +150,131 @@ def safe_save_json(data, final_path):
     temp_dir = os.path.dirname(final_path)
     fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".json.tmp")
     try:
-        with os.fdopen(fd, 'w', encoding=DEFAULT_ENCODING) as tmp:
-            json.dump(data, tmp, ensure_ascii=False, indent=4)
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS))
         os.replace(temp_path, final_path)
     except Exception as e:
         if os.path.exists(temp_path):
             os.remove(temp_path)
         raise IOError(f"🛑 [ERRO IO] Falha na escrita atômica JSON: {e}")
 
+def safe_save_jsonl(records, final_path):
+    """Escrita atômica em JSON Lines (um registro por linha) para leitura em lotes."""
+    temp_dir = os.path.dirname(final_path)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".jsonl.tmp")
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            for record in records:
+                tmp.write(orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE))
+        os.replace(temp_path, final_path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise IOError(f"🛑 [ERRO IO] Falha na escrita atômica JSONL: {e}")
+
+def safe_save_parquet(df, final_path):
+    """Escrita atômica em Parquet (zstd): formato tipado e colunar da camada Silver."""
+    temp_dir = os.path.dirname(final_path)
+    fd, temp_path = tempfile.mkstemp(dir=temp_dir, suffix=".parquet.tmp")
+    os.close(fd)
+    try:
+        df.to_parquet(temp_path, compression='zstd', index=False)
+        os.replace(temp_path, final_path)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise IOError(f"🛑 [ERRO IO] Falha na escrita atômica Parquet: {e}")
+
 def clean_for_excel(text):
-    """Filtra caracteres que causam IllegalCharacterError no openpyxl."""
+    """Filtra caracteres de controle que corrompem o XML da planilha."""
     if not isinstance(text, str):
         return text
-    return re.sub(r'[\000-\010]|[\013-\014]|[\016-\037]', "", text)
+    return ILLEGAL_CHARS_RE.sub("", text)
+
+def clean_frame_for_excel(df):
+    """Limpa colunas de texto; colunas sem caractere ilegal (caso comum) não são reescritas."""
+    df = df.copy(deep=False)  # Copy-on-Write: só as colunas alteradas são materializadas
+    for col in df.select_dtypes(include=['object', 'string']).columns:
+        if pd.api.types.infer_dtype(df[col], skipna=True) == 'string':
+            dirty = df[col].str.contains(ILLEGAL_CHARS_RE, na=False)
+            if dirty.any():
+                df.loc[dirty, col] = df.loc[dirty, col].str.replace(ILLEGAL_CHARS_RE, "", regex=True)
+        else:
+            df[col] = df[col].apply(clean_for_excel)
+    return df
+
+def check_sheet_size(df):
+    """Mesmo erro do to_excel do pandas: falha antes de gravar em vez de truncar a aba em silêncio."""
+    num_rows, num_cols = len(df) + 1, len(df.columns)  # +1 do cabeçalho
+    if num_rows > EXCEL_MAX_ROWS or num_cols > EXCEL_MAX_COLS:
+        raise ValueError(
+            f"This sheet is too large! Your sheet size is: {num_rows}, {num_cols} "
+            f"Max sheet size is: {EXCEL_MAX_ROWS}, {EXCEL_MAX_COLS}"
+        )
+
+def write_excel_sheet(workbook, sheet_name, df):
+    """Escrita linha a linha (constant_memory): cabeçalho + registros via itertuples."""
+    check_sheet_size(df)
+    worksheet = workbook.add_worksheet(sheet_name[:31])
+    worksheet.write_row(0, 0, list(df.columns))
+    df_cells = df.astype(object).where(df.notna(), None)
+    for r, row in enumerate(df_cells.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(r, 0, row)
+
+def column_letter(idx):
+    """Converte o índice da coluna (0-based) na letra do Excel: 0 -> A, 26 -> AA."""
+    letters, idx = "", idx + 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(65 + rem) + letters
+    return letters
+
+def cell_xml(ref, value):
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{ref}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"><v>{value!r}</v></c>' if math.isfinite(value) else ""
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(value))}</t></is></c>'
+
+def iter_sheet_xml(df, batch=10_000):
+    """Gera o sheetN.xml em blocos: inline strings, sem sharedStrings nem formatação."""
+    letters = [column_letter(j) for j in range(len(df.columns))]
+
+    def row_xml(r, row):
+        return f'<row r="{r}">' + "".join(cell_xml(f"{col}{r}", v) for col, v in zip(letters, row)) + "</row>"
+
+    yield (
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+    )
+    yield row_xml(1, df.columns).encode(DEFAULT_ENCODING)
+    df_cells = df.astype(object).where(df.notna(), None)
+    rows = enumerate(df_cells.itertuples(index=False, name=None), start=2)
+    while block := [row_xml(r, row) for r, row in islice(rows, batch)]:
+        yield "".join(block).encode(DEFAULT_ENCODING)
+    yield b"</sheetData></worksheet>"
+
+def inject_sheet_xml(xlsx_path, sheets):
+    """Reempacota o .xlsx trocando as abas-placeholder ({entrada_zip: df}) pelo XML gerado."""
+    fd, rebuilt_path = tempfile.mkstemp(dir=os.path.dirname(xlsx_path), suffix=".xlsx.tmp")
+    os.close(fd)
+    try:
+        with zipfile.ZipFile(xlsx_path) as src, \
+                zipfile.ZipFile(rebuilt_path, 'w', compression=zipfile.ZIP_DEFLATED) as dst:
+            for item in src.infolist():
+                if item.filename in sheets:
+                    with dst.open(item.filename, 'w', force_zip64=True) as f:
+                        for chunk in iter_sheet_xml(sheets[item.filename]):
+                            f.write(chunk)
+                else:
+                    dst.writestr(item, src.read(item.filename))
+        os.replace(rebuilt_path, xlsx_path)
+    except Exception:
+        if os.path.exists(rebuilt_path):
+            os.remove(rebuilt_path)
+        raise
 
 def process_student_id(email):
     """Gera Hash SHA-256 para IDs de estudantes se solicitado."""
@@ -126,6 +283,29 @@ def process_student_id(email):
     val = email.lower().strip()
     return hashlib.sha256(val.encode(DEFAULT_ENCODING)).hexdigest() if ANONYMIZE_STUDENTS else val
 
+def nested_field(series, key):
+    """Extrai uma chave de uma coluna de dicionários aninhados do JSON da API."""
+    return series.where(series.notna(), None).str.get(key)
+
+class RateLimiter:
+    """Token bucket thread-safe: distribui as requisições entre as threads do pool."""
+    def __init__(self, rate):
+        self.rate, self.tokens = rate, rate
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
 # --- CAMADA 1: BRONZE (EXTRAÇÃO COM TELEMETRIA PÁGINA A PÁGINA) ---
 class UdemyExtractor:
     def __init__(self, creds):
@@ -134,37 +314,126 @@ class UdemyExtractor:
             f"https://{creds.get('ACCOUNT_NAME')}.udemy.com/api-2.0/"
             f"organizations/{creds.get('ACCOUNT_ID')}"
         )
+        # Sessão única: reaproveita conexões TCP/TLS entre páginas e threads
+        self.session = requests.Session()
+        self.session.auth = self.auth
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=16, max_retries=API_RETRY)
+        self.session.mount("https://", adapter)
+        self.limiter = RateLimiter(API_RATE_LIMIT)
+
+    def fetch_page(self, url, label, page_num, page_dir):
+        """Lê a página do cache Bronze, revalidando-a na API via ETag/Last-Modified quando possível.
+
+        Retorna (dados, veio_do_cache); cache inclui respostas 304.
+        """
+        p_start = time.perf_counter()
+        p_path = self.page_path(page_dir, page_num)
+        cached = os.path.exists(p_path)
+        validators = self.cache_validators(p_path) if cached else {}
+
+        if cached and not validators:
+            with open(p_path, 'rb') as f:
+                p_data = orjson.loads(f.read())
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"📄 [CACHE] Página {page_num} de {label} lida do disco (⏳ {time.perf_counter()-p_start:.4f}s)")
+            return p_data, True
+
+        headers = {}
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+
+        self.limiter.acquire()
+        resp = self.session.get(url, headers=headers, timeout=API_TIMEOUT)
+        if resp.status_code == 304:
+            with open(p_path, 'rb') as f:
+                p_data = orjson.loads(f.read())
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"📄 [CACHE] Página {page_num} de {label} inalterada (304) (⏳ {time.perf_counter()-p_start:.4f}s)")
+            return p_data, True
+
+        resp.raise_for_status()
+        p_data = orjson.loads(resp.content)
+        safe_save_json(p_data, p_path)
+        safe_save_json(
+            {"etag": resp.headers.get('ETag'), "last_modified": resp.headers.get('Last-Modified')},
+            self.meta_path(p_path)
+        )
+        logger.info(
+            f"💾 [API] Página {page_num} de {label} baixada e salva: "
+            f"{len(p_data.get('results', []))} registros (⏳ {time.perf_counter()-p_start:.2f}s)"
+        )
+        return p_data, False
+
+    @staticmethod
+    def page_path(page_dir, page_num):
+        return f"{page_dir}/pag_{page_num:03d}.json"
+
+    @staticmethod
+    def meta_path(p_path):
+        return p_path.replace(".json", ".meta")
+
+    def cache_validators(self, p_path):
+        """Validadores HTTP da página em cache (vazio: cache sem revalidação, como antes)."""
+        meta_path = self.meta_path(p_path)
+        if not os.path.exists(meta_path):
+            return {}
+        with open(meta_path, 'rb') as f:
+            return {k: v for k, v in orjson.loads(f.read()).items() if v}
+
+    @staticmethod
+    def total_pages(p_data):
+        """Paginação numerada (?page=N) permite paralelizar; cursor exige leitura sequencial."""
+        next_url, count = p_data.get('next'), p_data.get('count')
+        page_size = len(p_data.get('results') or [])  # O servidor pode limitar abaixo do page_size pedido
+        if not next_url or count is None or not page_size or 'page' not in parse_qs(urlparse(next_url).query):
+            return None
+        return math.ceil(count / page_size)
 
     def fetch_paginated(self, endpoint, label, page_dir):
         t_start_ext = time.perf_counter()
         logger.info(f"📥 [BRONZE] Extração iniciada: {label}")
-        all_data, page_num = [], 1
-        next_url = f"{self.base_url}/{endpoint}?page_size=200"
-
+        first_url = f"{self.base_url}/{endpoint}?page_size={API_PAGE_SIZE}"
+        pages, from_cache = {}, {}
+        pages[1], from_cache[1] = self.fetch_page(first_url, label, 1, page_dir)
+        total_pages = self.total_pages(pages[1])
+
+        if total_pages:
+            logger.info(f"🧵 [BRONZE] {label}: {total_pages} páginas com até {API_MAX_WORKERS} downloads paralelos")
+            futures = {}
+            with ThreadPoolExecutor(max_workers=API_MAX_WORKERS) as pool:
+                for n in range(2, total_pages + 1):
+                    page_url = f"{first_url}&page={n}"
+                    p_path = self.page_path(page_dir, n)
+                    if os.path.exists(p_path) and not self.cache_validators(p_path):
+                        pages[n], from_cache[n] = self.fetch_page(page_url, label, n, page_dir)  # Cache: fora do pool
+                    else:
+                        futures[n] = pool.submit(self.fetch_page, page_url, label, n, page_dir)
+                for n, future in futures.items():
+                    pages[n], from_cache[n] = future.result()
+
+        # Cursor, ou páginas além da estimativa do pool: segue o 'next' da última página lida
+        page_num = max(pages)
+        next_url = pages[page_num].get('next')
+        if total_pages and next_url:
+            logger.warning(f"⚠️ [BRONZE] {label}: 'next' após a página {page_num}; seguindo sequencialmente")
         while next_url:
-            p_start = time.perf_counter()
-            p_path = f"{page_dir}/pag_{page_num:03d}.json"
-
-            if os.path.exists(p_path):
-                with open(p_path, 'r', encoding=DEFAULT_ENCODING) as f:
-                    p_data = json.load(f)
-                logger.info(f"📄 [CACHE] Página {page_num} de {label} lida do disco (⏳ {time.perf_counter()-p_start:.4f}s)")
-            else:
-                logger.info(f"📡 [API] Solicitando página {page_num} de {label}...")
-                resp = requests.get(next_url, auth=self.auth, timeout=API_TIMEOUT)
-                resp.raise_for_status()
-                p_data = resp.json()
-                safe_save_json(p_data, p_path)
-                logger.info(f"💾 [BRONZE] Página {page_num} baixada e salva (⏳ {time.perf_counter()-p_start:.2f}s)")
-                time.sleep(0.5)
-
-            current_res = p_data.get('results', [])
-            all_data.extend(current_res)
-            logger.info(f"📑 [METRICA] Página {page_num}: acumulado {len(all_data)} registros.")
-            next_url, page_num = p_data.get('next'), page_num + 1
-
-        consolidated_path = f"{BRONZE_DIR}/{label.lower().replace(' ', '_')}_consolidated.json"
-        safe_save_json(all_data, consolidated_path)
+            page_num += 1
+            pages[page_num], from_cache[page_num] = self.fetch_page(next_url, label, page_num, page_dir)
+            next_url = pages[page_num].get('next')
+
+        all_data = []
+        for page_num in sorted(pages):
+            all_data.extend(pages[page_num].get('results', []))
+        logger.info(f"📄 [CACHE] {label}: {sum(from_cache.values())} de {len(pages)} páginas lidas do disco")
+
+        expected = pages[1].get('count')
+        if expected is not None and len(all_data) != expected:
+            raise RuntimeError(f"🛑 [ERRO API] {label}: {len(all_data)} registros lidos, 'count' informa {expected}")
+
+        consolidated_path = f"{BRONZE_DIR}/{label.lower().replace(' ', '_')}_consolidated.jsonl"
+        safe_save_jsonl(all_data, consolidated_path)
         logger.info(f"📦 [BRONZE] Consolidação final de {label}: {len(all_data)} registros totais (⏳ {time.perf_counter()-t_start_ext:.2f}s)")
 
     def run(self):
@@ -174,100 +443,224 @@ class UdemyExtractor:
 
 # --- CAMADA 2: SILVER (MODELAGEM SNOWFLAKE EXAUSTIVA) ---
 class UdemyTransformer:
+    ACT_COLUMNS = [
+        'user_email', 'user_name', 'user_surname', 'user_is_deactivated',
+        'course_id', 'completion_ratio', 'course_last_accessed_date'
+    ]
+    ITEM_COLUMNS = ['user_email', 'course_id', 'item_title']
+    COURSE_COLUMNS = [
+        'id', 'title', 'locale', 'level', 'estimated_content_length_video', 'num_quizzes',
+        'num_practice_tests', 'has_closed_caption', 'is_practice_test_course',
+        'primary_category', 'primary_subcategory', 'visible_instructors'
+    ]
+
+    def __init__(self):
+        self.email_to_id, self.student_mask_map, self.mask_counter = {}, {}, 1
+
+    @staticmethod
+    def load_mask_map():
+        """Máscaras já atribuídas em execuções anteriores e o próximo número livre."""
+        if not os.path.exists(STUDENT_MASK_MAP):
+            return {}, 1
+        with open(STUDENT_MASK_MAP, 'rb') as f:
+            mask_map = orjson.loads(f.read())
+        return mask_map, max((int(v.split()[-1]) for v in mask_map.values()), default=0) + 1
+
+    @staticmethod
+    def iter_raw(name, columns):
+        """Lê o JSON Lines consolidado em lotes de BRONZE_CHUNK_SIZE registros."""
+        # dtype=object preserva os tipos originais do JSON (ex.: int com chave ausente não vira float)
+        emitted = False
+        with open(f"{BRONZE_DIR}/{name}.jsonl", 'rb') as f:
+            while lines := list(islice(f, BRONZE_CHUNK_SIZE)):
+                yield pd.DataFrame([orjson.loads(line) for line in lines if line.strip()], dtype=object, columns=columns)
+                emitted = True
+        if not emitted:
+            yield pd.DataFrame([], dtype=object, columns=columns)
+
+    def student_ids(self, emails):
+        """Cache de IDs: um único hash por e-mail distinto (evita N hashes do mesmo aluno)."""
+        for e in emails.dropna().unique():
+            if e and e not in self.email_to_id:
+                self.email_to_id[e] = process_student_id(e)
+        return emails.map(self.email_to_id)
+
+    def transform_progress(self, df_act):
+        df_act = df_act.assign(student_id=self.student_ids(df_act['user_email']))
+        df_act = df_act[df_act['student_id'].notna()]
+        if ANONYMIZE_STUDENTS:
+            # Numeração sequencial na ordem de primeira aparição; só alunos novos recebem número
+            for s_id in df_act['student_id'].unique():
+                if s_id not in self.student_mask_map:
+                    self.student_mask_map[s_id] = f"Aluno {self.mask_counter:02d}"
+                    self.mask_counter += 1
+            s_names = df_act['student_id'].map(self.student_mask_map)
+        else:
+            s_names = (df_act['user_name'].fillna('') + " " + df_act['user_surname'].fillna('')).str.strip()
+        return {
+            "stg_students": pd.DataFrame({
+                "student_id": df_act['student_id'], "full_name": s_names,
+                "status": df_act['user_is_deactivated']
+            }),
+            "stg_course_progress": pd.DataFrame({
+                "course_id": df_act['course_id'],
+                "student_id": df_act['student_id'],
+                "completion_ratio": df_act['completion_ratio'],
+                "last_accessed": df_act['course_last_accessed_date']
+            })
+        }
+
+    @staticmethod
+    def transform_courses(df_courses):
+        # Modelagem Snowflake: Dimensões Exaustivas (deduplicadas pela chave antes da tradução)
+        langs = pd.DataFrame({"language_id": nested_field(df_courses['locale'], 'locale')}).drop_duplicates()
+        langs["lang_pt_br"] = langs["language_id"].fillna('en').str.split('_').str[0].replace(LANGUAGE_MAP)
+        levels = df_courses['level'].fillna('All Levels').drop_duplicates()
+        cat_titles = nested_field(df_courses['primary_category'], 'title')
+        has_cat = cat_titles.notna() & (cat_titles != "")
+        cats = pd.DataFrame({
+            "cat_id": nested_field(df_courses.loc[has_cat, 'primary_category'], 'id'),
+            "cat_pt_br": cat_titles[has_cat]
+        }).drop_duplicates("cat_id")
+        cats["cat_pt_br"] = cats["cat_pt_br"].replace(CATEGORY_MAP)
+        sub_titles = nested_field(df_courses['primary_subcategory'], 'title')
+        has_sub = sub_titles.notna() & (sub_titles != "")
+        instructors = df_courses['visible_instructors'].explode().dropna()
+        return {
+            "stg_instructors": pd.DataFrame({
+                "instructor_id": nested_field(instructors, 'id'),
+                "instructor_name": nested_field(instructors, 'display_name')
+            }).drop_duplicates("instructor_id").reset_index(drop=True),
+            # Fato Cursos: Todas as métricas disponíveis
+            "stg_courses": pd.DataFrame({
+                "course_id": df_courses['id'],
+                "title_original": df_courses['title'],
+                "duracao_horas": (df_courses['estimated_content_length_video'].fillna(0).astype(float) / 60).round(2),
+                "num_quizzes": df_courses['num_quizzes'].fillna(0),
+                "num_practice_tests": df_courses['num_practice_tests'].fillna(0),
+                "has_closed_caption": df_courses['has_closed_caption'].fillna(False),
+                "is_practice_test_course": df_courses['is_practice_test_course'].fillna(False)
+            }),
+            "stg_languages": langs,
+            "stg_levels": pd.DataFrame({"level_id": levels, "level_pt_br": levels.replace(LEVEL_MAP)}),
+            "stg_categories": cats,
+            "stg_sub_categories": pd.DataFrame({
+                "sub_id": nested_field(df_courses.loc[has_sub, 'primary_subcategory'], 'id'),
+                "sub_original": sub_titles[has_sub]
+            }).drop_duplicates("sub_id")
+        }
+
+    def transform_activities(self, df_items):
+        item_titles = df_items['item_title']
+        return {
+            "stg_activity_items": pd.DataFrame({
+                "student_id": self.student_ids(df_items['user_email']).fillna("unknown"),
+                "course_id": df_items['course_id'],
+                "item_title": item_titles.where(item_titles.notna() & (item_titles != ""), "Item sem Título")
+            })
+        }
+
+    @staticmethod
+    def bronze_fingerprint():
+        """BLAKE2b do Bronze consolidado (o mtime muda a cada extração) e de tudo que molda a Silver."""
+        digests = {}
+        for path in sorted(glob.glob(f"{BRONZE_DIR}/*_consolidated.jsonl")):
+            h = hashlib.blake2b()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    h.update(block)
+            digests[os.path.basename(path)] = h.hexdigest()
+        # Mapas de tradução/chaves e o próprio código da transformação: editar qualquer um invalida o cache
+        transform = hashlib.blake2b(orjson.dumps(
+            [LANGUAGE_MAP, LEVEL_MAP, CATEGORY_MAP, DIMENSION_KEYS], option=orjson.OPT_SORT_KEYS
+        ))
+        with open(__file__, 'rb') as f:
+            transform.update(f.read())
+        return {"bronze": digests, "anonymize": ANONYMIZE_STUDENTS, "transform": transform.hexdigest()}
+
+    @staticmethod
+    def silver_is_current(fingerprint):
+        if not os.path.exists(SILVER_FINGERPRINT):
+            return False
+        with open(SILVER_FINGERPRINT, 'rb') as f:
+            stored = orjson.loads(f.read())
+        tables = stored.pop("tables", [])
+        return stored == fingerprint and all(
+            os.path.exists(f"{SILVER_DIR}/{name}.parquet") for name in tables
+        )
+
     def run(self):
+        """Retorna os DataFrames da Silver, ou None quando o cache (Bronze inalterado) é reaproveitado."""
         t_start_silver = time.perf_counter()
+        fingerprint = self.bronze_fingerprint()
+        if self.silver_is_current(fingerprint):
+            logger.info(f"⚡ [SILVER] Cache hit: Bronze inalterado, transformação ignorada (⏳ {time.perf_counter()-t_start_silver:.4f}s)")
+            return None
         logger.info(f"🔄 [SILVER] Transformação Snowflake Iniciada (Anonimização: {ANONYMIZE_STUDENTS})")
+        if ANONYMIZE_STUDENTS:
+            self.student_mask_map, self.mask_counter = self.load_mask_map()
+        parts = {}
 
-        def load_raw(name):
-            with open(f"{BRONZE_DIR}/{name}.json", 'r', encoding=DEFAULT_ENCODING) as f:
-                return json.load(f)
-
-        courses = load_raw("courses_consolidated")
-        course_act = load_raw("user_course_progress_consolidated")
-        activities = load_raw("activity_items_consolidated")
-
-        d_students, d_instructors, d_langs, d_levels, d_cats, d_subcats = [], [], [], [], [], []
-        f_courses, f_course_progress, f_activity_items = [], [], []
-        student_mask_map, mask_counter = {}, 1
+        def collect(chunk_frames):
+            for name, df in chunk_frames.items():
+                parts.setdefault(name, []).append(df)
 
         logger.info("👥 [PRIVACIDADE] Mapeando alunos e aplicando camuflagem sequencial...")
-        for act in course_act:
-            email = act.get('user_email')
-            if email:
-                s_id = process_student_id(email)
-                if ANONYMIZE_STUDENTS and s_id not in student_mask_map:
-                    student_mask_map[s_id] = f"Aluno {mask_counter:02d}"
-                    mask_counter += 1
-                s_name = (
-                    student_mask_map[s_id] if ANONYMIZE_STUDENTS
-                    else f"{act.get('user_name', '')} {act.get('user_surname', '')}".strip()
-                )
-                d_students.append({"student_id": s_id, "full_name": s_name, "status": act.get('user_is_deactivated')})
-                f_course_progress.append({
-                    "course_id": act.get('course_id'),
-                    "student_id": s_id,
-                    "completion_ratio": act.get('completion_ratio'),
-                    "last_accessed": act.get('course_last_accessed_date')
-                })
+        for chunk in self.iter_raw("user_course_progress_consolidated", self.ACT_COLUMNS):
+            collect(self.transform_progress(chunk))
 
         logger.info("🎓 [CURSOS] Extraindo dimensões e métricas completas de engajamento...")
-        for c in courses:
-            c_id, loc = c.get('id'), c.get('locale', {})
-            prefix = loc.get('locale', 'en').split('_')[0]
-
-            # Modelagem Snowflake: Dimensões Exaustivas
-            d_langs.append({"language_id": loc.get('locale'), "lang_pt_br": LANGUAGE_MAP.get(prefix, prefix)})
-            raw_lvl = c.get('level', 'All Levels')
-            d_levels.append({"level_id": raw_lvl, "level_pt_br": LEVEL_MAP.get(raw_lvl, raw_lvl)})
-            p_cat, p_sub = c.get('primary_category') or {}, c.get('primary_subcategory') or {}
-            if p_cat.get('title'):
-                d_cats.append({
-                    "cat_id": p_cat.get('id'),
-                    "cat_pt_br": CATEGORY_MAP.get(p_cat.get('title'), p_cat.get('title'))
-                })
-            if p_sub.get('title'):
-                d_subcats.append({"sub_id": p_sub.get('id'), "sub_original": p_sub.get('title')})
-            for inst in c.get('visible_instructors', []):
-                d_instructors.append({
-                    "instructor_id": inst.get('id'),
-                    "instructor_name": inst.get('display_name')
-                })
+        for chunk in self.iter_raw("courses_consolidated", self.COURSE_COLUMNS):
+            collect(self.transform_courses(chunk))
 
-            # Fato Cursos: Todas as métricas disponíveis
-            f_courses.append({
-                "course_id": c_id,
-                "title_original": c.get('title'),
-                "duracao_horas": round((c.get('estimated_content_length_video') or 0) / 60, 2),
-                "num_quizzes": c.get('num_quizzes', 0),
-                "num_practice_tests": c.get('num_practice_tests', 0),
-                "has_closed_caption": c.get('has_closed_caption', False),
-                "is_practice_test_course": c.get('is_practice_test_course', False)
-            })
+        for chunk in self.iter_raw("activity_items_consolidated", self.ITEM_COLUMNS):
+            collect(self.transform_activities(chunk))
 
-        for item in activities:
-            f_activity_items.append({
-                "student_id": process_student_id(item.get('user_email')),
-                "course_id": item.get('course_id'),
-                "item_title": item.get('item_title') or "Item sem Título"
-            })
-
-        datasets = {
-            "stg_students": d_students, "stg_instructors": d_instructors, "stg_courses": f_courses,
-            "stg_course_progress": f_course_progress, "stg_activity_items": f_activity_items,
-            "stg_languages": d_langs, "stg_levels": d_levels, "stg_categories": d_cats,
-            "stg_sub_categories": d_subcats
+        # Dimensões: uma linha por chave primária; fatos: deduplicação por registro completo
+        frames = {
+            name: pd.concat(dfs, ignore_index=True).infer_objects().drop_duplicates(DIMENSION_KEYS.get(name))
+            for name, dfs in parts.items()
         }
-        for name, data in datasets.items():
-            pd.DataFrame(data).drop_duplicates().to_json(
-                f"{SILVER_DIR}/{name}.json", orient='records',
-                force_ascii=False, indent=4
-            )
-        logger.info(f"🥈 [SILVER] {len(datasets)} datasets auditados (⏳ {time.perf_counter()-t_start_silver:.2f}s)")
+        if os.path.exists(SILVER_FINGERPRINT):
+            os.remove(SILVER_FINGERPRINT)  # Silver parcial nunca é tomada como cache válido
+        for name, df in frames.items():
+            safe_save_parquet(df, f"{SILVER_DIR}/{name}.parquet")
+        if ANONYMIZE_STUDENTS:
+            safe_save_json(self.student_mask_map, STUDENT_MASK_MAP)
+        safe_save_json({**fingerprint, "tables": sorted(frames)}, SILVER_FINGERPRINT)
+        logger.info(f"🥈 [SILVER] {len(frames)} datasets auditados (⏳ {time.perf_counter()-t_start_silver:.2f}s)")
+        return frames
 
 # --- CAMADA 3: GOLD (EXPORTAÇÃO CSV + XLSX COM TELEMETRIA POR ABA) ---
+def prepare_sheet(silver_name, df, emit_csv):
+    """Limpa e traduz cabeçalhos; com emit_csv grava o CSV a partir do mesmo DataFrame da aba."""
+    t_prep = time.perf_counter()
+    gold_name = TABLE_NAME_MAP.get(silver_name, silver_name)
+    df_final = clean_frame_for_excel(df).rename(columns=COLUMN_TRANSLATION_MAP)
+    if emit_csv:
+        df_final.to_csv(f"{GOLD_DIR}/{gold_name}.csv", index=False, encoding="utf-8-sig", lineterminator='\n')
+    return gold_name, df_final, time.perf_counter() - t_prep
+
 class UdemyLoader:
-    def run(self):
+    @staticmethod
+    def load_silver():
+        """Reidrata a camada Silver do disco (execução isolada do Gold)."""
+        datasets = {
+            file.replace(".parquet", ""): pd.read_parquet(f"{SILVER_DIR}/{file}")
+            for file in os.listdir(SILVER_DIR) if file.endswith(".parquet")
+        }
+        # Snapshots legados (stg_*.json em array): orjson + DataFrame, sem o caminho lento do read_json
+        for file in os.listdir(SILVER_DIR):
+            name = file.replace(".json", "")
+            if file.startswith("stg_") and file.endswith(".json") and name not in datasets:
+                with open(f"{SILVER_DIR}/{file}", 'rb') as f:
+                    datasets[name] = pd.DataFrame(orjson.loads(f.read()))
+        return datasets
+
+    def run(self, datasets=None):
         t_start_gold = time.perf_counter()
+        if datasets is None:
+            datasets = self.load_silver()
         logger.info("📤 [GOLD] Iniciando exportação final exaustiva...")
         if os.path.exists(GOLD_DIR):
             shutil.rmtree(GOLD_DIR)
@@ -276,22 +669,32 @@ class UdemyLoader:
         final_excel = f"{GOLD_DIR}/udemy_consolidated_report.xlsx"
         temp_excel = final_excel + ".tmp.xlsx"
 
+        names = sorted(datasets)
+        frames = [datasets[n] for n in names]
+        label = "Aba/CSV" if EMIT_CSV else "Aba"
         try:
-            with pd.ExcelWriter(temp_excel, engine='openpyxl') as writer:
-                for file in sorted(os.listdir(SILVER_DIR)):
-                    if file.endswith(".json"):
+            # CSVs em paralelo; sem CSV a limpeza roda no próprio processo (evita serializar os DataFrames)
+            pool_ctx = ProcessPoolExecutor(max_workers=min(GOLD_MAX_WORKERS, len(names) or 1)) if EMIT_CSV else nullcontext()
+            with pool_ctx as pool:
+                sheets = (pool.map if pool else map)(prepare_sheet, names, frames, [EMIT_CSV] * len(names))
+                # O XLSX (não serializável entre processos) é montado aqui, na ordem das abas
+                xml_sheets = {}
+                with xlsxwriter.Workbook(temp_excel, EXCEL_OPTIONS) as workbook:
+                    for gold_name, df_final, t_prep in sheets:
                         t_aba = time.perf_counter()
-                        silver_name = file.replace(".json", "")
-                        gold_name = TABLE_NAME_MAP.get(silver_name, silver_name)
-                        df = pd.read_json(f"{SILVER_DIR}/{file}", encoding=DEFAULT_ENCODING)
-
-                        for col in df.select_dtypes(include=['object']).columns:
-                            df[col] = df[col].apply(clean_for_excel)
-
-                        df_final = df.rename(columns=COLUMN_TRANSLATION_MAP)
-                        df_final.to_excel(writer, sheet_name=gold_name[:31], index=False)
-                        df_final.to_csv(f"{GOLD_DIR}/{gold_name}.csv", index=False, encoding="utf-8-sig")
-                        logger.info(f"🥇 [GOLD] Aba/CSV '{gold_name}' gerada (⏳ {time.perf_counter()-t_aba:.4f}s) | Linhas: {len(df_final)}")
+                        if len(df_final) > XML_SHEET_THRESHOLD:
+                            # Aba vazia reserva nome/ordem no workbook; o conteúdo entra como XML direto
+                            check_sheet_size(df_final)
+                            worksheet = workbook.add_worksheet(gold_name[:31])
+                            xml_sheets[f"xl/worksheets/sheet{worksheet.index + 1}.xml"] = df_final
+                            logger.info(f"🥇 [GOLD] {label} '{gold_name}' preparada para XML direto (⏳ preparo {t_prep:.4f}s) | Linhas: {len(df_final)}")
+                            continue
+                        write_excel_sheet(workbook, gold_name, df_final)
+                        logger.info(f"🥇 [GOLD] {label} '{gold_name}' gerada (⏳ preparo {t_prep:.4f}s + XLSX {time.perf_counter()-t_aba:.4f}s) | Linhas: {len(df_final)}")
+            if xml_sheets:
+                t_xml = time.perf_counter()
+                inject_sheet_xml(temp_excel, xml_sheets)
+                logger.info(f"🧩 [GOLD] {len(xml_sheets)} aba(s) grandes gravadas como XML direto (⏳ {time.perf_counter()-t_xml:.2f}s)")
             os.replace(temp_excel, final_excel)
             logger.info(f"✨ [GOLD] Relatório Final consolidado em {time.perf_counter()-t_start_gold:.2f}s")
         except Exception as e:
@@ -304,17 +707,17 @@ if __name__ == "__main__":
     logger.info("🚀 [START] Iniciando Pipeline de Dados Udemy Business v3.13.3")
     try:
         setup_directories()
-        with open("credencial.json", 'r', encoding=DEFAULT_ENCODING) as f:
-            creds_data = json.load(f)[0]
+        with open("credencial.json", 'rb') as f:
+            creds_data = orjson.loads(f.read())[0]
 
         extractor = UdemyExtractor(creds_data)
         extractor.run()
 
         transformer = UdemyTransformer()
-        transformer.run()
+        silver_datasets = transformer.run()  # None: cache Silver válido, o Gold lê do disco
 
         loader = UdemyLoader()
-        loader.run()
+        loader.run(silver_datasets)
         logger.info(f"🏁 [FINISH] Pipeline finalizado com SUCESSO TOTAL (⏳ {time.perf_counter()-t_global:.2f}s)")
     except Exception as e:
         logger.critical(f"🛑 [ERRO FATAL] {e}", exc_info=True)
\ No newline at end of file